@@ -34,11 +34,14 @@ setup(
 		"sklearn2pmml.util"
 	],
 	package_data = {
-		"sklearn2pmml.resources" : ["classpath.txt", "*.jar"]
+		"sklearn2pmml.resources" : ["classpath.txt", "sklearn2pmml.properties", "*.jar"]
 	},
 	install_requires = [
 		"joblib>=0.13.0",
 		"scikit-learn>=0.18.0",
 		"sklearn-pandas>=0.0.10"
-	]
+	],
+	extras_require = {
+		"jpype" : ["JPype1"]
+	}
 )
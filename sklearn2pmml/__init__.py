@@ -11,34 +11,39 @@ except ImportError:
 	from sklearn.feature_selection.base import SelectorMixin
 from sklearn.feature_selection import SelectFromModel
 from sklearn.pipeline import FeatureUnion, Pipeline
-from sklearn_pandas import DataFrameMapper
-from sklearn2pmml.resources import _package_classpath
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from sklearn2pmml.resources import _package_classpath, _package_properties
 from subprocess import PIPE, Popen
+from threading import Lock, Thread
 from zipfile import ZipFile
 
-import joblib
+import atexit
+import glob
 import numpy
 import os
-import pandas
-import platform
+import pathlib
 import re
 import sklearn
-import sklearn_pandas
+import sys
 import tempfile
 
 from .metadata import __copyright__, __license__, __version__
 from .pipeline import PMMLPipeline
 
 def _is_categorical(dtype):
-	if dtype == object or dtype == str or dtype == bool:
+	if isinstance(dtype, numpy.dtype):
+		# Object, byte string, unicode string and boolean dtypes
+		return dtype.kind in "OSUb"
+	elif dtype == object or dtype == str or dtype == bool:
 		return True
-	elif hasattr(dtype, "name") and dtype.name == "category":
-		return True
-	return False
+	return getattr(dtype, "name", None) == "category"
+
+_estimator_proxy_attr_names = ("feature_importances_", )
 
 class EstimatorProxy(BaseEstimator):
 
-	def __init__(self, estimator, attr_names = ["feature_importances_"]):
+	def __init__(self, estimator, attr_names = _estimator_proxy_attr_names):
 		self.estimator = estimator
 		self.attr_names = attr_names
 		try:
@@ -93,29 +98,107 @@ def _get_steps(obj):
 	else:
 		raise ValueError()
 
-def _filter(obj):
-	if isinstance(obj, DataFrameMapper):
-		obj.features = _filter_steps(obj.features)
-		if hasattr(obj, "built_features"):
-			if obj.built_features is not None:
-				obj.built_features = _filter_steps(obj.built_features)
-	elif isinstance(obj, ColumnTransformer):
-		obj.transformers = _filter_steps(obj.transformers)
-		obj.remainder = _filter(obj.remainder)
-		if hasattr(obj, "transformers_"):
-			obj.transformers_ = _filter_steps(obj.transformers_)
-	elif isinstance(obj, FeatureUnion):
-		obj.transformer_list = _filter_steps(obj.transformer_list)
-	elif isinstance(obj, Pipeline):
-		obj.steps = _filter_steps(obj.steps)
-	elif isinstance(obj, SelectorMixin):
-		return SelectorProxy(obj)
-	elif isinstance(obj, list):
-		return [_filter(e) for e in obj]
+def _filter_mapper(obj):
+	obj.features = _filter_steps(obj.features)
+	if hasattr(obj, "built_features"):
+		if obj.built_features is not None:
+			obj.built_features = _filter_steps(obj.built_features)
+	return obj
+
+def _filter_column_transformer(obj):
+	obj.transformers = _filter_steps(obj.transformers)
+	obj.remainder = _filter(obj.remainder)
+	if hasattr(obj, "transformers_"):
+		obj.transformers_ = _filter_steps(obj.transformers_)
+	return obj
+
+def _filter_feature_union(obj):
+	obj.transformer_list = _filter_steps(obj.transformer_list)
+	return obj
+
+def _filter_pipeline(obj):
+	obj.steps = _filter_steps(obj.steps)
 	return obj
 
+def _filter_list(obj):
+	return [_filter(e) for e in obj]
+
+def _filter_identity(obj):
+	return obj
+
+# Handlers in the order of precedence
+_filter_handlers = [
+	(ColumnTransformer, _filter_column_transformer),
+	(FeatureUnion, _filter_feature_union),
+	(Pipeline, _filter_pipeline),
+	(SelectorMixin, SelectorProxy),
+	(list, _filter_list)
+]
+
+# Maps exact types to handlers, is extended lazily with subclasses and unhandled types
+_filter_dispatch = dict(_filter_handlers)
+
+def _resolve_filter_handler(cls):
+	# DataFrameMapper objects cannot exist before the sklearn_pandas package has been imported
+	sklearn_pandas = sys.modules.get("sklearn_pandas")
+	if sklearn_pandas is not None and issubclass(cls, sklearn_pandas.DataFrameMapper):
+		return _filter_mapper
+	for handler_cls, handler in _filter_handlers:
+		if issubclass(cls, handler_cls):
+			return handler
+	return _filter_identity
+
+def _get_filter_handler(obj):
+	cls = type(obj)
+	handler = _filter_dispatch.get(cls)
+	if handler is None:
+		handler = _resolve_filter_handler(cls)
+		_filter_dispatch[cls] = handler
+	return handler
+
+def _filter(obj):
+	return _get_filter_handler(obj)(obj)
+
 def _filter_steps(steps):
-	return [(step[:1] + (_filter(step[1]), ) + step[2:]) for step in steps]
+	return [(step[0], _filter(step[1]), *step[2:]) for step in steps]
+
+def _mapper_needs_filter(obj):
+	return _steps_need_filter(obj.features) or _steps_need_filter(getattr(obj, "built_features", None) or [])
+
+def _column_transformer_needs_filter(obj):
+	return _steps_need_filter(obj.transformers) or _needs_filter(obj.remainder) or _steps_need_filter(getattr(obj, "transformers_", []))
+
+def _feature_union_needs_filter(obj):
+	return _steps_need_filter(obj.transformer_list)
+
+def _pipeline_needs_filter(obj):
+	return _steps_need_filter(obj.steps)
+
+def _list_needs_filter(obj):
+	return any(_needs_filter(e) for e in obj)
+
+def _selector_needs_filter(obj):
+	return True
+
+def _identity_needs_filter(obj):
+	return False
+
+# Maps filter handlers to visitors, which tell if filtering would replace any (nested) object
+_needs_filter_dispatch = {
+	_filter_mapper: _mapper_needs_filter,
+	_filter_column_transformer: _column_transformer_needs_filter,
+	_filter_feature_union: _feature_union_needs_filter,
+	_filter_pipeline: _pipeline_needs_filter,
+	SelectorProxy: _selector_needs_filter,
+	_filter_list: _list_needs_filter,
+	_filter_identity: _identity_needs_filter
+}
+
+def _needs_filter(obj):
+	return _needs_filter_dispatch[_get_filter_handler(obj)](obj)
+
+def _steps_need_filter(steps):
+	return any(_needs_filter(step[1]) for step in steps)
 
 def make_pmml_pipeline(obj, active_fields = None, target_fields = None):
 	"""Translates a regular Scikit-Learn estimator or pipeline to a PMML pipeline.
@@ -131,9 +214,15 @@ def make_pmml_pipeline(obj, active_fields = None, target_fields = None):
 	target_fields: list of strings, optional
 		Label name(s). If missing, "y" is assumed.
 
+	If the object is a PMML pipeline already, and none of its steps needs translation, then it is returned as-is.
+	In that case, the active_fields and target_fields arguments are set on the object itself.
+
 	"""
-	steps = _filter_steps(_get_steps(obj))
-	pipeline = PMMLPipeline(steps)
+	if isinstance(obj, PMMLPipeline) and not _needs_filter(obj):
+		pipeline = obj
+	else:
+		steps = _filter_steps(_get_steps(obj))
+		pipeline = PMMLPipeline(steps)
 	if active_fields is not None:
 		pipeline.active_fields = numpy.asarray(active_fields)
 	if target_fields is not None:
@@ -146,16 +235,18 @@ def _decode(data, encoding):
 	except ValueError:
 		return ""
 
+_java_version_re = re.compile(r"^(.*)\sversion\s\"(.*)\"(|\s\d\d\d\d\-\d\d\-\d\d)$", re.MULTILINE)
+
 def _java_version(java_encoding, java_home = ""):
 	try:
-		process = Popen([java_home + "java", "-version"], stdout = PIPE, stderr = PIPE, bufsize = 1)
+		process = Popen([java_home + "java", "-version"], stdout = PIPE, stderr = PIPE, bufsize = -1)
 	except:
 		return None
 	output, error = process.communicate()
 	retcode = process.poll()
 	if retcode:
 		return None
-	match = re.match("^(.*)\sversion\s\"(.*)\"(|\s\d\d\d\d\-\d\d\-\d\d)$", _decode(error, java_encoding), re.MULTILINE)
+	match = _java_version_re.match(_decode(error, java_encoding))
 	if match:
 		return (match.group(1), match.group(2))
 	else:
@@ -164,26 +255,188 @@ def _java_version(java_encoding, java_home = ""):
 def _classpath(user_classpath):
 	return _package_classpath() + user_classpath
 
-def _process_classpath(name, fun, user_classpath):
-	jars = _classpath(user_classpath)
-	for jar in jars:
-		with ZipFile(jar, "r") as zipfile:
+_zipfile_cache = dict()
+_zipfile_cache_lock = Lock()
+
+def _get_zipfile(path):
+	key = (path, os.stat(path).st_mtime_ns)
+	zipfile = _zipfile_cache.get(key)
+	if zipfile is not None:
+		return zipfile
+	# Read the central directory outside of the lock, so that JAR files can be opened concurrently
+	zipfile = ZipFile(path, "r")
+	with _zipfile_cache_lock:
+		# Evict handles to earlier versions of the same file
+		for stale_key in [k for k in _zipfile_cache.keys() if k[0] == path and k != key]:
+			_zipfile_cache.pop(stale_key).close()
+		cached_zipfile = _zipfile_cache.setdefault(key, zipfile)
+	# Another thread has opened the same file in the meantime
+	if cached_zipfile is not zipfile:
+		zipfile.close()
+	return cached_zipfile
+
+@atexit.register
+def _close_zipfiles():
+	with _zipfile_cache_lock:
+		for zipfile in _zipfile_cache.values():
+			zipfile.close()
+		_zipfile_cache.clear()
+
+def _read_zipentry(jar, name):
+	zipfile = _get_zipfile(jar)
+	zipentry = zipfile.NameToInfo.get(name)
+	if zipentry is None:
+		return None
+	return zipfile.read(zipentry)
+
+def _process_jars(name, fun, jars):
+	if len(jars) > 1:
+		with ThreadPoolExecutor(max_workers = min(8, len(jars))) as executor:
+			datas = list(executor.map(lambda jar: _read_zipentry(jar, name), jars))
+	else:
+		datas = [_read_zipentry(jar, name) for jar in jars]
+	# Invoke the callback sequentially, in classpath order
+	for data in datas:
+		if data is not None:
+			fun(BytesIO(data))
+
+# The JPMML-SkLearn side decompresses zlib streams only, so faster codecs such as LZ4 or Zstandard are not an option here
+_dump_codec = "zlib"
+
+def _dump(obj, prefix, compress = 1):
+	import joblib
+
+	if compress:
+		fd, path = tempfile.mkstemp(prefix = (prefix + "-"), suffix = ".pkl.z")
+		compress = (_dump_codec, compress)
+	else:
+		fd, path = tempfile.mkstemp(prefix = (prefix + "-"), suffix = ".pkl")
+	with os.fdopen(fd, "wb") as file:
+		joblib.dump(obj, file, compress = compress)
+	return path
+
+def _communicate(process, obj, compress = 1):
+	import joblib
+
+	errors = []
+	def feed():
+		try:
+			joblib.dump(obj, process.stdin, compress = (_dump_codec, compress))
+		# The Java process has exited prematurely, and its error stream says why
+		except BrokenPipeError:
+			pass
+		except Exception as e:
+			errors.append(e)
+		finally:
 			try:
-				zipentry = zipfile.getinfo(name)
-			except KeyError:
+				process.stdin.close()
+			except BrokenPipeError:
 				pass
-			else:
-				fun(zipfile.open(zipentry))
+	# Serialize into the standard input while draining the standard output and error streams, so that none of the pipes can fill up and block the other side
+	outputs = dict()
+	def drain(name, stream):
+		outputs[name] = stream.read()
+	threads = [Thread(target = feed), Thread(target = drain, args = ("error", process.stderr))]
+	for thread in threads:
+		thread.start()
+	drain("output", process.stdout)
+	for thread in threads:
+		thread.join()
+	process.wait()
+	if errors:
+		raise errors[0]
+	return outputs["output"], outputs["error"]
+
+# The Java executable can read the joblib dump from its standard input only on platforms that expose it as a file
+_stdin_path = "/dev/stdin"
+
+def _can_stream(compress):
+	# Uncompressed dumps may be re-opened by the Java side, which is not possible for a pipe
+	return compress > 0 and os.path.exists(_stdin_path)
+
+def _manifest_attribute(name, value):
+	# Manifest lines are limited to 72 bytes, and longer values are continued on lines that start with a single space
+	line = name + ": " + value
+	lines = [line[:72]]
+	line = line[72:]
+	while line:
+		lines.append(" " + line[:71])
+		line = line[71:]
+	return "\r\n".join(lines) + "\r\n"
+
+def _make_classpath_jar(classpath):
+	# A manifest-only JAR file keeps the command line short irrespective of the length of the classpath
+	# File URIs are plain ASCII, so that character counts equal byte counts
+	class_path = " ".join([pathlib.Path(os.path.abspath(jar)).as_uri() for jar in classpath])
+	manifest = "Manifest-Version: 1.0\r\n" + _manifest_attribute("Class-Path", class_path) + "\r\n"
+	fd, path = tempfile.mkstemp(prefix = "classpath-", suffix = ".jar")
+	with os.fdopen(fd, "wb") as file:
+		with ZipFile(file, "w") as zipfile:
+			zipfile.writestr("META-INF/MANIFEST.MF", manifest)
+	return path
 
-def _dump(obj, prefix):
-	fd, path = tempfile.mkstemp(prefix = (prefix + "-"), suffix = ".pkl.z")
+# Shared library locations relative to the Java installation directory, for Java 9+ and Java 8 layouts
+_jvm_library_patterns = [
+	os.path.join("lib", "server", "libjvm.so"),
+	os.path.join("jre", "lib", "*", "server", "libjvm.so"),
+	os.path.join("lib", "server", "libjvm.dylib"),
+	os.path.join("jre", "lib", "server", "libjvm.dylib"),
+	os.path.join("bin", "server", "jvm.dll"),
+	os.path.join("jre", "bin", "server", "jvm.dll")
+]
+
+def _find_jvmpath(java_home):
+	# The java_home argument is the directory of the Java executable
+	home = os.path.dirname(os.path.abspath(java_home))
+	for pattern in _jvm_library_patterns:
+		jvmpaths = sorted(glob.glob(os.path.join(home, pattern)))
+		if jvmpaths:
+			return jvmpaths[0]
+	raise RuntimeError("The JVM shared library was not found in the Java installation at " + home)
+
+_persistent_jvm_classpath = None
+_persistent_jvm_path = None
+_persistent_jvm_lock = Lock()
+
+def _start_persistent_jvm(jpype, classpath, java_home = ""):
+	global _persistent_jvm_classpath, _persistent_jvm_path
+	jvmpath = _find_jvmpath(java_home) if java_home else None
+	with _persistent_jvm_lock:
+		if not jpype.isJVMStarted():
+			if jvmpath is not None:
+				jpype.startJVM(jvmpath, classpath = classpath, convertStrings = False)
+			else:
+				jpype.startJVM(classpath = classpath, convertStrings = False)
+			_persistent_jvm_classpath = classpath
+			_persistent_jvm_path = jvmpath
+		elif _persistent_jvm_classpath is not None:
+			# The classpath and the Java installation of a running JVM cannot be changed
+			if not set(classpath).issubset(_persistent_jvm_classpath):
+				raise RuntimeError("The persistent JVM has been started with a different classpath. Use the same 'user_classpath' argument across all conversions")
+			if jvmpath != _persistent_jvm_path:
+				raise RuntimeError("The persistent JVM has been started with a different Java installation. Use the same 'java_home' argument across all conversions")
+
+def _run_persistent(classpath, pipeline_pkl, pmml, java_home = ""):
 	try:
-		joblib.dump(obj, path, compress = 3)
-	finally:
-		os.close(fd)
-	return path
+		import jpype
+	except ImportError:
+		raise RuntimeError("The persistent JVM mode requires the JPype1 package. Install it using 'pip install sklearn2pmml[jpype]'")
+	_start_persistent_jvm(jpype, classpath, java_home)
+	try:
+		Main = jpype.JClass("org.jpmml.sklearn.Main")
+		File = jpype.JClass("java.io.File")
+	# The JVM has been started by other code, without the JPMML-SkLearn classpath
+	except Exception as e:
+		raise RuntimeError("The JPMML-SkLearn conversion application is not on the classpath of the persistent JVM: {0}".format(e))
+	main = Main()
+	main.setInput(File(pipeline_pkl))
+	main.setOutput(File(pmml))
+	try:
+		main.run()
+	except jpype.JException as e:
+		raise RuntimeError("The JPMML-SkLearn conversion application has failed: {0}".format(e))
 
-def sklearn2pmml(pipeline, pmml, user_classpath = [], with_repr = False, debug = False, java_encoding = "UTF-8", java_home = ""):
+def sklearn2pmml(pipeline, pmml, user_classpath = [], with_repr = False, debug = False, java_encoding = "UTF-8", java_home = "", compress = 1, persistent_jvm = False):
 	"""Converts a fitted PMML pipeline object to PMML file.
 
 	Parameters:
@@ -207,8 +460,22 @@ def sklearn2pmml(pipeline, pmml, user_classpath = [], with_repr = False, debug =
 	java_encoding: string, optional
 		The character encoding to use for decoding Java output and error byte streams.
 
+	compress: int, optional
+		The zlib compression level (from 0 to 9) of the intermediate joblib dump file.
+		Level 0 writes an uncompressed file (fastest, largest), level 1 is optimized for latency, level 3 is the old default.
+
+	persistent_jvm: boolean, optional
+		If true, run the conversion in a JVM that is embedded into the Python process using the JPype1 package, and that is kept alive between calls.
+		The JVM is started by the first call, with the classpath and the Java installation (as located via java_home) of that call.
+		Requires the JPype1 package, which can be installed using 'pip install sklearn2pmml[jpype]'.
+
 	"""
 	if debug:
+		import joblib
+		import pandas
+		import platform
+		import sklearn_pandas
+
 		java_version = _java_version(java_encoding, java_home)
 		if java_version is None:
 			java_version = ("java", "N/A")
@@ -223,7 +490,6 @@ def sklearn2pmml(pipeline, pmml, user_classpath = [], with_repr = False, debug =
 	if not isinstance(pipeline, PMMLPipeline):
 		raise TypeError("The pipeline object is not an instance of " + PMMLPipeline.__name__ + ". Use the 'sklearn2pmml.make_pmml_pipeline(obj)' utility function to translate a regular Scikit-Learn estimator or pipeline to a PMML pipeline")
 	estimator = pipeline._final_estimator
-	cmd = [java_home + "java", "-cp", os.pathsep.join(_classpath(user_classpath)), "org.jpmml.sklearn.Main"]
 	dumps = []
 	try:
 		if with_repr:
@@ -233,17 +499,34 @@ def sklearn2pmml(pipeline, pmml, user_classpath = [], with_repr = False, debug =
 			estimator_mojo = estimator.download_mojo()
 			dumps.append(estimator_mojo)
 			estimator._mojo_path = estimator_mojo
-		pipeline_pkl = _dump(pipeline, "pipeline")
+		if persistent_jvm:
+			pipeline_pkl = _dump(pipeline, "pipeline", compress = compress)
+			dumps.append(pipeline_pkl)
+			_run_persistent(_classpath(user_classpath), pipeline_pkl, pmml, java_home)
+			return
+		classpath = _classpath(user_classpath)
+		classpath_jar = _make_classpath_jar(classpath)
+		dumps.append(classpath_jar)
+		cmd = [java_home + "java", "-cp", classpath_jar, "org.jpmml.sklearn.Main"]
+		stream = not debug and _can_stream(compress)
+		if stream:
+			pipeline_pkl = _stdin_path
+		else:
+			pipeline_pkl = _dump(pipeline, "pipeline", compress = compress)
+			dumps.append(pipeline_pkl)
 		cmd.extend(["--pkl-pipeline-input", pipeline_pkl])
-		dumps.append(pipeline_pkl)
 		cmd.extend(["--pmml-output", pmml])
 		if debug:
+			print("Classpath:\n{0}".format(os.pathsep.join(classpath)))
 			print("Executing command:\n{0}".format(" ".join(cmd)))
 		try:
-			process = Popen(cmd, stdout = PIPE, stderr = PIPE, bufsize = 1)
+			process = Popen(cmd, stdin = (PIPE if stream else None), stdout = PIPE, stderr = PIPE, bufsize = -1)
 		except OSError:
 			raise RuntimeError("Java is not installed, or the Java executable is not on system path")
-		output, error = process.communicate()
+		if stream:
+			output, error = _communicate(process, pipeline, compress = compress)
+		else:
+			output, error = process.communicate()
 		retcode = process.poll()
 		if debug or retcode:
 			if(len(output) > 0):
@@ -258,26 +541,26 @@ def sklearn2pmml(pipeline, pmml, user_classpath = [], with_repr = False, debug =
 			raise RuntimeError("The JPMML-SkLearn conversion application has failed. The Java executable should have printed more information about the failure into its standard output and/or standard error streams")
 	finally:
 		if debug:
-			print("Preserved joblib dump file(s): {0}".format(" ".join(dumps)))
+			print("Preserved temporary file(s): {0}".format(" ".join(dumps)))
 		else:
 			for dump in dumps:
 				os.remove(dump)
 
-def _parse_properties(lines):
-	splitter = re.compile("\s*=\s*")
+def _parse_properties(data):
 	properties = dict()
-	for line in lines:
-		line = line.decode("UTF-8").rstrip()
-		if line.startswith("#"):
+	for line in data.decode("UTF-8").splitlines():
+		line = line.rstrip()
+		if not line or line.startswith("#"):
 			continue
-		key, value = splitter.split(line)
-		properties[key] = value
+		key, _, value = line.partition("=")
+		properties[key.rstrip()] = value.lstrip()
 	return properties
 
 def _supported_classes(user_classpath):
-	classes = []
-	parser = lambda x: classes.extend(_parse_properties(x.readlines()).keys())
-	_process_classpath("META-INF/sklearn2pmml.properties", parser, user_classpath)
+	# The properties of package JAR files are bundled at build time, so only user JAR files need to be scanned
+	classes = list(_parse_properties(_package_properties()).keys())
+	parser = lambda x: classes.extend(_parse_properties(x.read()).keys())
+	_process_jars("META-INF/sklearn2pmml.properties", parser, user_classpath)
 	return classes
 
 def _strip_module(name):
@@ -1,4 +1,3 @@
-from pandas import DataFrame, Series
 from sklearn.base import BaseEstimator, ClassifierMixin, RegressorMixin
 from sklearn.pipeline import Pipeline
 
@@ -20,6 +19,8 @@ def _filter_column_names(X):
 	return (numpy.asarray(X)).astype(str);
 
 def _get_column_names(X):
+	from pandas import DataFrame, Series
+
 	if isinstance(X, DataFrame):
 		return _filter_column_names(X.columns.values)
 	elif isinstance(X, Series):
@@ -31,6 +32,8 @@ def _get_column_names(X):
 		return None
 
 def _get_values(X):
+	from pandas import DataFrame, Series
+
 	if isinstance(X, DataFrame):
 		return X.values
 	elif isinstance(X, Series):
@@ -1,7 +1,16 @@
+from functools import lru_cache
+
 import pkg_resources
 
-def _package_classpath():
-	jars = []
+@lru_cache(maxsize = 1)
+def _load_package_classpath():
 	with open(pkg_resources.resource_filename("sklearn2pmml.resources", "classpath.txt")) as classpath:
-		jars = [pkg_resources.resource_filename("sklearn2pmml.resources", jar_name.strip()) for jar_name in classpath.readlines()]
-	return jars
\ No newline at end of file
+		return tuple(pkg_resources.resource_filename("sklearn2pmml.resources", jar_name.strip()) for jar_name in classpath.readlines())
+
+def _package_classpath():
+	return list(_load_package_classpath())
+
+@lru_cache(maxsize = 1)
+def _package_properties():
+	with open(pkg_resources.resource_filename("sklearn2pmml.resources", "sklearn2pmml.properties"), "rb") as properties:
+		return properties.read()
\ No newline at end of file
@@ -1,13 +1,27 @@
 from pandas import DataFrame, Series
 from sklearn.dummy import DummyRegressor
 from sklearn.feature_selection import f_regression, SelectFromModel, SelectKBest
-from sklearn.pipeline import Pipeline
+from sklearn.pipeline import FeatureUnion, Pipeline
 from sklearn.tree import DecisionTreeRegressor
-from sklearn2pmml import _classpath, _filter, _filter_steps, _is_categorical, _java_version, _strip_module, _supported_classes, make_pmml_pipeline, make_tpot_pmml_config, EstimatorProxy, SelectorProxy
+from sklearn_pandas import DataFrameMapper
+from sklearn2pmml import _classpath, _close_zipfiles, _communicate, _dump, _filter, _filter_steps, _get_zipfile, _is_categorical, _java_version, _make_classpath_jar, _parse_properties, _process_jars, _run_persistent, _strip_module, _supported_classes, make_pmml_pipeline, make_tpot_pmml_config, EstimatorProxy, SelectorProxy
 from sklearn2pmml.pipeline import PMMLPipeline
-from unittest import TestCase
+from zipfile import ZipFile
+from subprocess import PIPE, Popen
+from unittest import skipUnless, TestCase
+from unittest.mock import patch
 
+import joblib
 import numpy
+import os
+import pandas
+import pickle
+import shutil
+import sklearn2pmml
+import sys
+import tempfile
+import time
+import types
 
 class DTypeTest(TestCase):
 
@@ -22,6 +36,12 @@ class DTypeTest(TestCase):
 		self.assertTrue(_is_categorical(x.dtype))
 		x = x.astype(int)
 		self.assertFalse(_is_categorical(x.dtype))
+		self.assertTrue(_is_categorical(numpy.dtype("U5")))
+		self.assertTrue(_is_categorical(str))
+		self.assertTrue(_is_categorical(bool))
+		self.assertFalse(_is_categorical(float))
+		self.assertFalse(_is_categorical(pandas.StringDtype()))
+		self.assertFalse(_is_categorical(pandas.BooleanDtype()))
 
 class EstimatorProxyTest(TestCase):
 
@@ -40,6 +60,25 @@ class EstimatorProxyTest(TestCase):
 		self.assertEqual(1.0, regressor.constant_)
 		self.assertEqual(1.0, regressor_proxy.constant_)
 
+	def test_pickle(self):
+		regressor = DummyRegressor()
+		regressor_proxy = EstimatorProxy(regressor, attr_names = ["constant_"])
+		regressor_proxy.fit(numpy.array([[0], [0]]), numpy.array([0.0, 2.0]))
+		regressor_proxy = pickle.loads(pickle.dumps(regressor_proxy))
+		self.assertEqual([1.0], regressor_proxy.predict(numpy.array([[0]])).tolist())
+
+	def test_set_params(self):
+		regressor = DummyRegressor(strategy = "constant", constant = 5.0)
+		regressor.fit(numpy.array([[0]]), numpy.array([0.0]))
+		other_regressor = DummyRegressor(strategy = "constant", constant = 7.0)
+		other_regressor.fit(numpy.array([[0]]), numpy.array([0.0]))
+		regressor_proxy = EstimatorProxy(regressor)
+		self.assertEqual([5.0], regressor_proxy.predict(numpy.array([[0]])).tolist())
+		regressor_proxy.set_params(estimator = other_regressor)
+		self.assertEqual([7.0], regressor_proxy.predict(numpy.array([[0]])).tolist())
+		regressor_proxy.estimator = regressor
+		self.assertEqual([5.0], regressor_proxy.predict(numpy.array([[0]])).tolist())
+
 class SelectorProxyTest(TestCase):
 
 	def test_init(self):
@@ -77,6 +116,28 @@ class SelectorProxyTest(TestCase):
 		self.assertIsInstance(selector_proxy, SelectorProxy)
 		self.assertEqual([0, 1], selector_proxy.support_mask_.tolist())
 
+class FilterTest(TestCase):
+
+	def test_filter(self):
+		union = FeatureUnion([
+			("selector", SelectKBest(score_func = f_regression, k = 1))
+		])
+		pipeline = PMMLPipeline([
+			("union", union),
+			("regressor", DecisionTreeRegressor())
+		])
+		pipeline = _filter(Pipeline([("pipeline", pipeline)]))
+		self.assertIsInstance(pipeline.steps[0][1], PMMLPipeline)
+		self.assertIsInstance(union.transformer_list[0][1], SelectorProxy)
+		self.assertIsInstance(pipeline.steps[0][1].steps[1][1], DecisionTreeRegressor)
+		mapper = _filter(DataFrameMapper([
+			(["x1", "x2"], [SelectKBest(score_func = f_regression, k = 1)])
+		]))
+		self.assertIsInstance(mapper.features[0][1][0], SelectorProxy)
+		selectors = _filter([SelectKBest(), DecisionTreeRegressor()])
+		self.assertIsInstance(selectors[0], SelectorProxy)
+		self.assertIsInstance(selectors[1], DecisionTreeRegressor)
+
 class JavaTest(TestCase):
 
 	def test_java_version(self):
@@ -92,9 +153,59 @@ class ClasspathTest(TestCase):
 		classpath = _classpath(["A.jar", "B.jar"])
 		self.assertEqual(22 + 2, len(classpath))
 
+	def test_get_zipfile(self):
+		jar = _classpath([])[0]
+		zipfile = _get_zipfile(jar)
+		self.assertIs(zipfile, _get_zipfile(jar))
+
+	def test_get_zipfile_concurrent(self):
+		class SlowZipFile(ZipFile):
+
+			def __init__(self, *args, **kwargs):
+				time.sleep(0.1)
+				super(SlowZipFile, self).__init__(*args, **kwargs)
+		jars = _classpath([])[:8]
+		_close_zipfiles()
+		try:
+			with patch("sklearn2pmml.ZipFile", SlowZipFile):
+				begin = time.time()
+				_process_jars("META-INF/MANIFEST.MF", lambda x: None, jars)
+				end = time.time()
+			# Serialized opens would take at least 0.8 seconds
+			self.assertLess(end - begin, 0.5)
+			for jar in jars:
+				self.assertIsInstance(_get_zipfile(jar), SlowZipFile)
+		finally:
+			_close_zipfiles()
+
+	def test_make_classpath_jar(self):
+		classpath = _classpath([os.path.join("lib", "x" * 100, "A B.jar")])
+		classpath_jar = _make_classpath_jar(classpath)
+		try:
+			with ZipFile(classpath_jar, "r") as zipfile:
+				manifest = zipfile.read("META-INF/MANIFEST.MF")
+		finally:
+			os.remove(classpath_jar)
+		lines = manifest.split(b"\r\n")
+		self.assertTrue(all(len(line) <= 72 for line in lines))
+		manifest = manifest.replace(b"\r\n ", b"").decode("UTF-8")
+		class_path = [line for line in manifest.split("\r\n") if line.startswith("Class-Path: ")][0]
+		uris = class_path[len("Class-Path: "):].split(" ")
+		self.assertEqual(len(classpath), len(uris))
+		self.assertTrue(all(uri.startswith("file:") for uri in uris))
+		self.assertTrue(uris[-1].endswith("/A%20B.jar"))
+
+	def test_parse_properties(self):
+		properties = _parse_properties(b"# Comment\nsklearn.dummy.DummyRegressor = org.jpmml.sklearn.DummyRegressor\n\nsklearn.tree.DecisionTreeRegressor=org.jpmml.sklearn.TreeRegressor\r\n")
+		self.assertEqual({"sklearn.dummy.DummyRegressor" : "org.jpmml.sklearn.DummyRegressor", "sklearn.tree.DecisionTreeRegressor" : "org.jpmml.sklearn.TreeRegressor"}, properties)
+
 	def test_supported_classes(self):
 		classes = _supported_classes([])
 		self.assertTrue(len(classes) > 100)
+		jar_classes = []
+		parser = lambda x: jar_classes.extend(_parse_properties(x.read()).keys())
+		_process_jars("META-INF/sklearn2pmml.properties", parser, _classpath([]))
+		self.assertEqual(sorted(jar_classes), sorted(classes))
 
 	def test_strip_module(self):
 		self.assertEqual("sklearn.decomposition.PCA", _strip_module("sklearn.decomposition.pca.PCA"))
@@ -102,6 +213,141 @@ class ClasspathTest(TestCase):
 		self.assertEqual("sklearn.preprocessing.StandardScaler", _strip_module("sklearn.preprocessing.data.StandardScaler"))
 		self.assertEqual("sklearn.tree.DecisionTreeClassifier", _strip_module("sklearn.tree.tree.DecisionTreeClassifier"))
 
+class DumpTest(TestCase):
+
+	def test_dump(self):
+		estimator = DummyRegressor()
+		for compress in [0, 1, 3]:
+			path = _dump(estimator, "estimator", compress = compress)
+			try:
+				self.assertEqual(compress > 0, path.endswith(".pkl.z"))
+				self.assertIsInstance(joblib.load(path), DummyRegressor)
+			finally:
+				os.remove(path)
+
+class _Unpicklable(object):
+
+	def __reduce__(self):
+		raise TypeError("Not picklable")
+
+@skipUnless(os.path.exists("/dev/stdin"), "Requires /dev/stdin")
+class CommunicateTest(TestCase):
+
+	def _popen(self, script):
+		return Popen([sys.executable, "-c", script], stdin = PIPE, stdout = PIPE, stderr = PIPE)
+
+	def test_communicate(self):
+		# Flood the standard error stream before and the standard output stream after reading the standard input
+		process = self._popen("import joblib, sys; sys.stderr.write('x' * (5 * 1024 * 1024)); sys.stderr.flush(); print(repr(joblib.load('/dev/stdin'))); sys.stdout.write('y' * (5 * 1024 * 1024))")
+		output, error = _communicate(process, DummyRegressor())
+		self.assertEqual(0, process.returncode)
+		self.assertTrue(output.startswith(b"DummyRegressor()"))
+		self.assertEqual(5 * 1024 * 1024, len(error))
+
+	def test_communicate_exit(self):
+		process = self._popen("import sys; sys.stderr.write('Failed'); sys.exit(1)")
+		output, error = _communicate(process, numpy.random.rand(1000, 1000))
+		self.assertEqual(1, process.returncode)
+		self.assertEqual(b"", output)
+		self.assertEqual(b"Failed", error)
+
+	def test_communicate_unpicklable(self):
+		process = self._popen("import sys; sys.stdin.buffer.read()")
+		with self.assertRaises(TypeError):
+			_communicate(process, _Unpicklable())
+		self.assertEqual(0, process.returncode)
+
+class _JException(Exception):
+	pass
+
+def _make_jpype(classes):
+	jpype = types.ModuleType("jpype")
+	jpype.JException = _JException
+	jpype.started = []
+	jpype.runs = []
+	jpype.jvmpaths = []
+	jpype.isJVMStarted = lambda: len(jpype.started) > 0
+	def startJVM(*args, classpath, convertStrings):
+		jpype.jvmpaths.append(args[0] if args else None)
+		jpype.started.append(classpath)
+	jpype.startJVM = startJVM
+	class Main(object):
+
+		def setInput(self, input):
+			self.input = input
+
+		def setOutput(self, output):
+			self.output = output
+
+		def run(self):
+			if self.input == "fail.pkl":
+				raise _JException("Failed")
+			jpype.runs.append((self.input, self.output))
+	def JClass(name):
+		if name not in classes:
+			raise TypeError("Class {0} is not found".format(name))
+		return {"org.jpmml.sklearn.Main" : Main, "java.io.File" : str}[name]
+	jpype.JClass = JClass
+	return jpype
+
+class PersistentJVMTest(TestCase):
+
+	def setUp(self):
+		sklearn2pmml._persistent_jvm_classpath = None
+		sklearn2pmml._persistent_jvm_path = None
+
+	def tearDown(self):
+		sklearn2pmml._persistent_jvm_classpath = None
+		sklearn2pmml._persistent_jvm_path = None
+
+	def test_run_persistent(self):
+		jpype = _make_jpype(["org.jpmml.sklearn.Main", "java.io.File"])
+		with patch.dict(sys.modules, {"jpype" : jpype}):
+			_run_persistent(["A.jar", "B.jar"], "pipeline.pkl", "pipeline.pmml")
+			self.assertEqual([["A.jar", "B.jar"]], jpype.started)
+			self.assertEqual([None], jpype.jvmpaths)
+			_run_persistent(["A.jar"], "pipeline.pkl", "pipeline.pmml")
+			self.assertEqual(1, len(jpype.started))
+			self.assertEqual([("pipeline.pkl", "pipeline.pmml")] * 2, jpype.runs)
+			with self.assertRaises(RuntimeError):
+				_run_persistent(["A.jar", "C.jar"], "pipeline.pkl", "pipeline.pmml")
+			with self.assertRaises(RuntimeError):
+				_run_persistent(["A.jar"], "fail.pkl", "pipeline.pmml")
+			self.assertEqual(2, len(jpype.runs))
+
+	def test_run_persistent_java_home(self):
+		home = tempfile.mkdtemp()
+		try:
+			java_home = os.path.join(home, "bin") + os.sep
+			jpype = _make_jpype(["org.jpmml.sklearn.Main", "java.io.File"])
+			with patch.dict(sys.modules, {"jpype" : jpype}):
+				with self.assertRaises(RuntimeError):
+					_run_persistent(["A.jar"], "pipeline.pkl", "pipeline.pmml", java_home)
+				self.assertEqual([], jpype.started)
+				jvmpath = os.path.join(home, "lib", "server", "libjvm.so")
+				os.makedirs(os.path.dirname(jvmpath))
+				open(jvmpath, "w").close()
+				_run_persistent(["A.jar"], "pipeline.pkl", "pipeline.pmml", java_home)
+				self.assertEqual([jvmpath], jpype.jvmpaths)
+				with self.assertRaises(RuntimeError):
+					_run_persistent(["A.jar"], "pipeline.pkl", "pipeline.pmml")
+				self.assertEqual(1, len(jpype.runs))
+		finally:
+			shutil.rmtree(home)
+
+	def test_run_persistent_foreign_jvm(self):
+		jpype = _make_jpype(["java.io.File"])
+		jpype.started.append(["Other.jar"])
+		with patch.dict(sys.modules, {"jpype" : jpype}):
+			with self.assertRaises(RuntimeError):
+				_run_persistent(["A.jar"], "pipeline.pkl", "pipeline.pmml")
+
+	def test_run_persistent_missing(self):
+		# A None entry makes the import statement fail with an ImportError
+		with patch.dict(sys.modules, {"jpype" : None}):
+			with self.assertRaises(RuntimeError):
+				_run_persistent(["A.jar"], "pipeline.pkl", "pipeline.pmml")
+
 class FunctionTest(TestCase):
 
 	def test_make_pmml_pipeline(self):
@@ -113,6 +359,14 @@ class FunctionTest(TestCase):
 		])
 		pmml_pipeline = make_pmml_pipeline(pipeline)
 		self.assertTrue(isinstance(pmml_pipeline, PMMLPipeline))
+		self.assertIs(pmml_pipeline, make_pmml_pipeline(pmml_pipeline, active_fields = ["x"], target_fields = ["y"]))
+		self.assertEqual(["x"], pmml_pipeline.active_fields.tolist())
+		self.assertEqual(["y"], pmml_pipeline.target_fields.tolist())
+		pmml_pipeline = PMMLPipeline([
+			("selector", SelectKBest(score_func = f_regression, k = 1)),
+			("estimator", estimator)
+		])
+		self.assertIsNot(pmml_pipeline, make_pmml_pipeline(pmml_pipeline))
 
 	def test_make_tpot_pmml_config(self):
 		config = {